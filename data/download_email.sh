@@ -1,6 +1,14 @@
 #!/usr/bin/bash
 
+# Pass --archives-only to just download the tarballs, which run_report.py
+# can read directly with --archives ../data/email_data/download/*.tar.bz2
+
 set -e
+archives_only=false
+if [ "$1" == "--archives-only" ]; then
+    archives_only=true
+fi
+
 mkdir email_data
 
 cd email_data
@@ -10,37 +18,46 @@ mkdir ham
 cd download
 
 wget https://spamassassin.apache.org/old/publiccorpus/20050311_spam_2.tar.bz2
-bunzip2 20050311_spam_2.tar.bz2
-tar -xvf 20050311_spam_2.tar
-cd spam_2
-for filename in *; do cp "$filename" "../../spam/$filename"_spam2; done;
-cd ..
+if [ "$archives_only" == false ]; then
+    bunzip2 20050311_spam_2.tar.bz2
+    tar -xvf 20050311_spam_2.tar
+    cd spam_2
+    for filename in *; do cp "$filename" "../../spam/$filename"_spam2; done;
+    cd ..
+fi
 
 wget https://spamassassin.apache.org/old/publiccorpus/20030228_spam.tar.bz2
-bunzip2 20030228_spam.tar.bz2
-tar -xvf 20030228_spam.tar
-cd spam
-for filename in *; do cp "$filename" "../../spam/$filename"_spam; done;
-cd ..
+if [ "$archives_only" == false ]; then
+    bunzip2 20030228_spam.tar.bz2
+    tar -xvf 20030228_spam.tar
+    cd spam
+    for filename in *; do cp "$filename" "../../spam/$filename"_spam; done;
+    cd ..
+fi
 
 wget https://spamassassin.apache.org/old/publiccorpus/20030228_hard_ham.tar.bz2
-bunzip2 20030228_hard_ham.tar.bz2
-tar -xvf 20030228_hard_ham.tar
-cd hard_ham
-for filename in *; do cp "$filename" "../../ham/$filename"_hard_ham; done;
-cd ..
+if [ "$archives_only" == false ]; then
+    bunzip2 20030228_hard_ham.tar.bz2
+    tar -xvf 20030228_hard_ham.tar
+    cd hard_ham
+    for filename in *; do cp "$filename" "../../ham/$filename"_hard_ham; done;
+    cd ..
+fi
 
 wget https://spamassassin.apache.org/old/publiccorpus/20030228_easy_ham.tar.bz2
-bunzip2 20030228_easy_ham.tar.bz2
-tar -xvf 20030228_easy_ham.tar
-cd easy_ham
-for filename in *; do cp "$filename" "../../ham/$filename"_easy_ham; done;
-cd ..
+if [ "$archives_only" == false ]; then
+    bunzip2 20030228_easy_ham.tar.bz2
+    tar -xvf 20030228_easy_ham.tar
+    cd easy_ham
+    for filename in *; do cp "$filename" "../../ham/$filename"_easy_ham; done;
+    cd ..
+fi
 
 wget https://spamassassin.apache.org/old/publiccorpus/20030228_easy_ham_2.tar.bz2
-bunzip2 20030228_easy_ham_2.tar.bz2
-tar -xvf 20030228_easy_ham_2.tar
-cd easy_ham_2
-for filename in *; do cp "$filename" "../../ham/$filename"_easy_ham_2; done;
-cd ..
-
+if [ "$archives_only" == false ]; then
+    bunzip2 20030228_easy_ham_2.tar.bz2
+    tar -xvf 20030228_easy_ham_2.tar
+    cd easy_ham_2
+    for filename in *; do cp "$filename" "../../ham/$filename"_easy_ham_2; done;
+    cd ..
+fi
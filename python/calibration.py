@@ -0,0 +1,152 @@
+import numpy as np
+
+# Changing how much the svm favors ham over spam used to mean retraining with a
+# different weight. Everything here works on the margins (emails @ weight + off) of a
+# held-out set instead, so an operating point can be picked without another solve.
+#
+# Margins are positive for ham, matching the signs used in svm.py, so the calibrated
+# probabilities are probabilities of ham.
+
+# Platt scaling, fits P(ham | margin) = 1 / (1 + exp(a * margin + b)) by Newton's method
+# on the regularized targets from Platt's paper, which keep it from overfitting to
+# a perfectly separated held-out set
+class PlattScaling:
+
+    kind = 'platt'
+
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def fit(cls, margins, signs, iterations=100, tol=1e-8):
+        is_ham = signs > 0
+        num_ham = np.count_nonzero(is_ham)
+        num_spam = len(signs) - num_ham
+        target = np.where(is_ham, (num_ham + 1.0) / (num_ham + 2.0), 1.0 / (num_spam + 2.0))
+
+        def loss(a, b):
+            f = margins * a + b
+            return np.sum(target * np.logaddexp(0, f) + (1 - target) * np.logaddexp(0, -f))
+
+        a, b = 0.0, np.log((num_spam + 1.0) / (num_ham + 1.0))
+        current = loss(a, b)
+        for _ in range(iterations):
+            f = margins * a + b
+            p = np.exp(-np.logaddexp(0, f))
+            d = target - p
+            w = p * (1 - p)
+
+            grad = np.array([np.sum(d * margins), np.sum(d)])
+            if np.max(np.abs(grad)) < tol:
+                break
+            hess = np.array([[np.sum(w * margins * margins) + 1e-12, np.sum(w * margins)],
+                             [np.sum(w * margins), np.sum(w) + 1e-12]])
+            step = np.linalg.solve(hess, grad)
+
+            # Newton's method can overshoot, so back off until the loss goes down
+            scale = 1.0
+            while scale > 1e-10:
+                new = loss(a - scale * step[0], b - scale * step[1])
+                if new < current:
+                    break
+                scale /= 2
+            else:
+                break
+            a, b = a - scale * step[0], b - scale * step[1]
+            current = new
+
+        return cls(a, b)
+
+    def predict(self, margins):
+        return np.exp(-np.logaddexp(0, margins * self.a + self.b))
+
+    def params(self):
+        return {'a': self.a, 'b': self.b}
+
+# Isotonic regression, a monotone step function from margin to P(ham) fit with
+# pool adjacent violators over the sorted held-out margins
+class IsotonicRegression:
+
+    kind = 'isotonic'
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    @classmethod
+    def fit(cls, margins, signs):
+        # Tied margins have to share a value, so they're pooled up front
+        x, inverse = np.unique(margins, return_inverse=True)
+        sums = np.bincount(inverse, weights=(signs > 0).astype(np.float64))
+        counts = np.bincount(inverse).astype(np.float64)
+
+        values = []
+        weights = []
+        sizes = []
+        for total, count in zip(sums, counts):
+            values.append(total / count)
+            weights.append(count)
+            sizes.append(1)
+            while len(values) > 1 and values[-2] > values[-1]:
+                value, weight, size = values.pop(), weights.pop(), sizes.pop()
+                values[-1] = (values[-1] * weights[-1] + value * weight) / (weights[-1] + weight)
+                weights[-1] += weight
+                sizes[-1] += size
+
+        return cls(x, np.repeat(values, sizes))
+
+    def predict(self, margins):
+        return np.interp(margins, self.x, self.y)
+
+    def params(self):
+        return {'x': self.x, 'y': self.y}
+
+calibrations = {cls.kind: cls for cls in (PlattScaling, IsotonicRegression)}
+
+# The whole ham/spam accuracy tradeoff in one sorted pass over the margins. An email
+# is called ham when its margin is above the threshold, so every distinct margin
+# (plus -inf, calling everything ham) is a possible operating point.
+def threshold_sweep(margins, signs):
+    order = np.argsort(margins, kind='stable')
+    sorted_margins = margins[order]
+    is_ham = signs[order] > 0
+
+    num_ham = np.count_nonzero(is_ham)
+    num_spam = len(is_ham) - num_ham
+
+    ham_below = np.concatenate([[0], np.cumsum(is_ham)])
+    spam_below = np.concatenate([[0], np.cumsum(~is_ham)])
+    thresholds = np.concatenate([[-np.inf], sorted_margins])
+
+    # With tied margins only the last of each run is a real cut
+    keep = np.concatenate([[True], sorted_margins[:-1] != sorted_margins[1:], [True]])
+
+    ham_acc = (num_ham - ham_below[keep]) / max(num_ham, 1)
+    spam_acc = spam_below[keep] / max(num_spam, 1)
+    return thresholds[keep], ham_acc, spam_acc
+
+# Ham accuracy only goes down as the threshold goes up and spam accuracy only goes up,
+# so the best spam accuracy that keeps ham accuracy at min_ham is the last threshold that does
+def pick_threshold(thresholds, ham_acc, spam_acc, min_ham):
+    return thresholds[np.nonzero(ham_acc >= min_ham)[0][-1]]
+
+# Extra arrays for svm.save_model, and the matching loader
+def model_arrays(threshold, calibration=None):
+    arrays = {'threshold': float(threshold)}
+    if calibration is not None:
+        arrays['calibration'] = calibration.kind
+        arrays.update({'calibration_' + key: value for key, value in calibration.params().items()})
+    return arrays
+
+def load_operating_point(fname):
+    with np.load(fname) as model:
+        threshold = float(model['threshold']) if 'threshold' in model.files else 0.0
+        if 'calibration' not in model.files:
+            return threshold, None
+        cls = calibrations[str(model['calibration'])]
+        params = {key[len('calibration_'):]: model[key] for key in model.files
+                  if key.startswith('calibration_')}
+        if cls is PlattScaling:
+            params = {key: float(value) for key, value in params.items()}
+        return threshold, cls(**params)
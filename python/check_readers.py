@@ -0,0 +1,79 @@
+#stdlib includes
+import argparse
+import os
+import sys
+import tarfile
+import tempfile
+
+#internal includes
+import process_email
+import readers
+
+# A message in the same shape as the SpamAssassin corpus files, From envelope line included
+sample = """From jm@example.com  Thu Aug 22 12:36:23 2002
+Return-Path: <jm@example.com>
+Received: from localhost (jalapeno [127.0.0.1])
+    by example.com (Postfix) with ESMTP id 1234
+Message-Id: <20020822113623.ABC@example.com>
+Subject: Meeting
+Content-Type: text/plain
+
+Let's meet tomorrow at 10, see http://example.com/agenda for the plan.
+"""
+
+other = """From spam@example.net  Fri Aug 23 01:02:03 2002
+Subject: Cheap pills
+
+Buy now for only $5!
+"""
+
+# Each reader has to hand process_email the same text for the same message, or
+# the same email would turn into different features depending on how it was stored
+def read_all_ways(tmp):
+    message_file = os.path.join(tmp, '00001.sample')
+    with open(message_file, 'w') as out:
+        out.write(sample)
+
+    corpus_dir = os.path.join(tmp, 'easy_ham')
+    os.mkdir(corpus_dir)
+    with open(os.path.join(corpus_dir, '00001.sample'), 'w') as out:
+        out.write(sample)
+    with open(os.path.join(corpus_dir, 'cmds'), 'w') as out:
+        out.write('mv 00001.abc 00001.sample\n')
+    archive = os.path.join(tmp, '20030228_easy_ham.tar.bz2')
+    with tarfile.open(archive, 'w:bz2') as tar:
+        tar.add(corpus_dir, arcname='easy_ham')
+
+    mbox = os.path.join(tmp, 'easy_ham.mbox')
+    with open(mbox, 'w') as out:
+        out.write(other + '\n' + sample + '\n' + other)
+
+    # Read the same way run_report.file_to_words reads a corpus file
+    with open(message_file, errors='ignore') as email:
+        texts = {'file': email.read()}
+    texts['tar'] = [text for _, text in readers.iter_tar(archive)][0]
+    texts['mbox'] = [text for _, text in readers.iter_mbox(mbox)][1]
+    return texts
+
+def check_readers():
+    with tempfile.TemporaryDirectory() as tmp:
+        texts = read_all_ways(tmp)
+
+    expected = process_email.process_email(texts['file'])
+    print("{:<10} {}".format('file', ' '.join(expected)))
+
+    ok = True
+    for name in ['tar', 'mbox']:
+        words = process_email.process_email(texts[name])
+        status = 'ok' if words == expected else 'differs: ' + ' '.join(words)
+        ok = ok and words == expected
+        print("{:<10} {}".format(name, status))
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that a message tokenizes the same from a file, '
+                                                 'a tar archive, and an mbox')
+    parser.parse_args()
+
+    if not check_readers():
+        sys.exit(1)
@@ -0,0 +1,113 @@
+#stdlib includes
+import argparse
+import os
+import subprocess
+import sys
+
+# Importing any of these costs more than the rest of a short job put together, so
+# none of the entry points should pull them in until they're actually needed
+heavy_modules = ['cvxpy', 'scipy', 'matplotlib']
+
+# Import times swing a lot between machines, so budgets are headroom in ms over a bare
+# import numpy measured in the same run, which most of the entry points pay anyway.
+# A regression of a few tens of ms on top of what they import today should show up.
+headroom_ms = {
+    'process_email': 0,
+    'stemmer': 0,
+    'svm': 25,
+    'run_report': 50,
+    'run_example': 40,
+    'classify': 60,
+}
+
+baseline_module = 'numpy'
+
+# Used for any module without its own headroom
+default_headroom_ms = 25
+
+# Parses the stderr of python -X importtime into (module, depth, cumulative us)
+def parse_importtime(output):
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        yield name.strip(), depth, int(cumulative)
+
+# Returns the total import time, the heavy modules pulled in, and the error
+# if the module failed to import
+def measure_import(module):
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                            cwd=here, stderr=subprocess.PIPE, universal_newlines=True)
+    imports = list(parse_importtime(result.stderr))
+
+    total_ms = sum(cumulative for _, depth, cumulative in imports if depth == 0) / 1000
+    heavy = sorted(set(name.split('.')[0] for name, _, _ in imports) & set(heavy_modules))
+
+    error = None
+    if result.returncode != 0:
+        lines = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        error = lines[-1] if lines else 'exit status {}'.format(result.returncode)
+    return total_ms, heavy, error
+
+# A single cold import is noisy, so each module is imported runs times, interleaved
+# with the baseline so they see the same machine, and the fastest run is kept
+def measure_imports(modules, runs):
+    best = {}
+    for _ in range(runs):
+        for module in [baseline_module] + modules:
+            total_ms, heavy, error = measure_import(module)
+            if module not in best or total_ms < best[module][0] or error is not None:
+                best[module] = (total_ms, heavy, error)
+    return best
+
+# headroom overrides the per-module headroom when given
+def check_startup(modules, runs, headroom=None):
+    best = measure_imports(modules, runs)
+
+    baseline_ms, _, error = best[baseline_module]
+    print("{:<15} {:8.1f} ms  baseline".format(baseline_module, baseline_ms))
+    if error is not None:
+        print("Baseline {} failed to import: {}".format(baseline_module, error))
+        return False
+
+    ok = True
+    for module in modules:
+        extra = headroom if headroom is not None else headroom_ms.get(module, default_headroom_ms)
+        budget = baseline_ms + extra
+        total_ms, heavy, error = best[module]
+        status = 'ok'
+        if error is not None:
+            status = 'failed to import: ' + error
+            ok = False
+        elif heavy:
+            status = 'imports ' + ', '.join(heavy)
+            ok = False
+        elif total_ms > budget:
+            status = 'over budget of {:.1f} ms ({} + {})'.format(budget, baseline_module, extra)
+            ok = False
+        print("{:<15} {:8.1f} ms  {}".format(module, total_ms, status))
+    return ok
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the entry points import quickly and '
+                                                 'without pulling in cvxpy, scipy or matplotlib',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--modules", nargs='+', help="Modules to check",
+                        default=sorted(headroom_ms))
+    parser.add_argument("--runs", type=int, help="Imports of each module to take the fastest of",
+                        default=5)
+    parser.add_argument("--headroom-ms", type=float,
+                        help="Time allowed over the numpy baseline for every module, "
+                             "instead of the per-module headroom")
+
+    args = parser.parse_args()
+
+    if args.runs <= 0:
+        parser.error("Runs is {}, must be positive".format(args.runs))
+
+    if not check_startup(args.modules, args.runs, args.headroom_ms):
+        sys.exit(1)
@@ -0,0 +1,151 @@
+#stdlib includes
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import concurrent.futures
+
+#internal includes
+import calibration
+import process_email
+import svm
+from run_report import load_vocab, file_to_word_vec, words_to_vec, bounded_map
+
+# Set once per worker process by init_worker, so the vocab and weights are
+# pickled once per process instead of once per message
+_vocab = None
+_weight = None
+_off = None
+
+def init_worker(vocab, weight, off):
+    global _vocab, _weight, _off
+    _vocab = vocab
+    _weight = weight
+    _off = off
+
+# Items are (source, text) pairs. Files in a directory are read by the worker,
+# so only the path crosses the process boundary; archive and mbox messages come
+# with their text. Returns (source, margin, error), so one unreadable file doesn't
+# take the rest of the run down with it.
+def score_item(item):
+    source, text = item
+    try:
+        if text is None:
+            vec = file_to_word_vec(source, _vocab)
+        else:
+            vec = words_to_vec(process_email.process_email(text), _vocab)
+    except OSError as e:
+        return source, None, str(e)
+    return source, float(vec @ _weight + _off), None
+
+# Single message files go down the same path as files in a directory,
+# so they're only read as mbox files when asked to
+def iter_inputs(paths, mbox=False):
+    # readers pulls in tarfile and mailbox, which plain directories don't need
+    import readers
+
+    for path in paths:
+        if os.path.isdir(path):
+            try:
+                names = sorted(os.listdir(path))
+            except OSError as e:
+                print("Skipping {}: {}".format(path, e), file=sys.stderr)
+                continue
+            for name in names:
+                fname = os.path.join(path, name)
+                if os.path.isfile(fname):
+                    yield fname, None
+        elif readers.is_archive(path) or mbox:
+            yield from readers.iter_messages(path)
+        else:
+            yield path, None
+
+class CsvOutput:
+
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+        self.writer.writerow(['source', 'verdict', 'margin', 'ham_probability'])
+
+    def write(self, source, verdict, margin, probability):
+        self.writer.writerow([source, verdict, '' if margin is None else margin,
+                              '' if probability is None else probability])
+
+class JsonlOutput:
+
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, source, verdict, margin, probability):
+        self.out.write(json.dumps({'source': source, 'verdict': verdict, 'margin': margin,
+                                   'ham_probability': probability}) + '\n')
+
+outputs = {'csv': CsvOutput, 'jsonl': JsonlOutput}
+
+def classify(paths, model, vocab_file, out, fmt, workers, chunksize, mbox=False):
+    weight, off = svm.load_model(model)
+    # Models saved with run_report.py --calibrate also carry a threshold and calibration
+    threshold, calibrator = calibration.load_operating_point(model)
+    vocab = load_vocab(vocab_file)
+    writer = outputs[fmt](out)
+
+    workers = workers or os.cpu_count()
+
+    count = 0
+    errors = 0
+    start = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=init_worker,
+                                                initargs=(vocab, weight, off)) as executor:
+        for source, margin, error in bounded_map(executor, score_item, iter_inputs(paths, mbox),
+                                                 chunksize, workers * chunksize * 4):
+            count += 1
+            if error is not None:
+                print("Could not read {}: {}".format(source, error), file=sys.stderr)
+                writer.write(source, 'error', None, None)
+                errors += 1
+                continue
+            probability = None if calibrator is None else float(calibrator.predict(margin))
+            writer.write(source, 'ham' if margin > threshold else 'spam', margin, probability)
+            if count % chunksize == 0:
+                out.flush()
+    elapsed = time.perf_counter() - start
+    return count, errors, elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify directories of mail, mbox files, or tar archives with a trained svm',
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("inputs", nargs='+', help="Directories of one-message-per-file mail, single messages, mbox files, or tar archives")
+    parser.add_argument("--model", help="Model saved by run_report.py --save-model", required=True)
+    parser.add_argument("--vocab", help="Vocab file the model was trained with",
+                        default=os.path.join('..', 'data', 'vocab.txt'))
+    parser.add_argument("--output", help="File to write verdicts to, - for stdout",
+                        default='-')
+    parser.add_argument("--format", choices=sorted(outputs), help="Output format",
+                        default='csv')
+    parser.add_argument("--workers", type=int, help="Worker processes, defaults to all cores")
+    parser.add_argument("--chunksize", type=int, help="Messages sent to a worker at a time",
+                        default=64)
+    parser.add_argument("--mbox", action='store_true',
+                        help="Read input files that aren't tar archives as mbox files instead of single messages")
+
+    args = parser.parse_args()
+
+    if args.chunksize <= 0:
+        parser.error("Chunk size is {}, must be positive".format(args.chunksize))
+
+    missing = [path for path in args.inputs if not os.path.exists(path)]
+    if missing:
+        parser.error("Inputs not found: {}".format(', '.join(missing)))
+
+    if args.output == '-':
+        count, errors, elapsed = classify(args.inputs, args.model, args.vocab, sys.stdout,
+                                          args.format, args.workers, args.chunksize, args.mbox)
+    else:
+        with open(args.output, 'w', newline='') as out:
+            count, errors, elapsed = classify(args.inputs, args.model, args.vocab, out,
+                                              args.format, args.workers, args.chunksize, args.mbox)
+
+    print("Classified {} messages in {:.2f} seconds ({:.1f} messages/sec), {} could not be read".format(
+        count, elapsed, count / elapsed if elapsed > 0 else 0.0, errors), file=sys.stderr)
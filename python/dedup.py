@@ -0,0 +1,80 @@
+import hashlib
+import zlib
+
+import numpy as np
+
+# The SpamAssassin corpus has a lot of repeated mail in it - the same message shows
+# up in both spam and spam_2, and the easy_ham folders share mailing list traffic that
+# only differs in the headers. Leaving those in makes the problem handed to the solver
+# bigger than it needs to be, and lets copies of a test email sneak into the training set.
+#
+# The index works on the token stream from process_email rather than the raw file, so
+# messages that only differ in stripped headers are exact duplicates. Near duplicates
+# are caught with a MinHash signature over word shingles, bucketed with the usual
+# banding trick so each new email is only compared against likely candidates.
+class DedupIndex:
+
+    def __init__(self, num_perm=64, bands=16, threshold=0.8, shingle=3, seed=0):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm ({}) must be a multiple of bands ({})".format(num_perm, bands))
+
+        rng = np.random.RandomState(seed)
+        # multiply-shift hashing, a must be odd for the family to be universal
+        self._a = rng.randint(0, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self._b = rng.randint(0, 2**63, num_perm, dtype=np.uint64)
+
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.threshold = threshold
+        self.shingle = shingle
+
+        self._hashes = set()
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = []
+
+        self.exact = 0
+        self.near = 0
+
+    @property
+    def dropped(self):
+        return self.exact + self.near
+
+    def signature(self, words):
+        k = min(self.shingle, len(words))
+        shingles = np.fromiter((zlib.crc32(' '.join(words[i:i+k]).encode())
+                                for i in range(len(words) - k + 1)),
+                               dtype=np.uint64)
+        # uint64 arithmetic wraps, which is exactly what multiply-shift wants
+        hashed = (self._a[:, None] * shingles[None, :] + self._b[:, None]) >> np.uint64(32)
+        return hashed.min(axis=1)
+
+    # Returns True if the email is new and was added to the index,
+    # False if it duplicates something already seen
+    def add(self, words):
+        digest = hashlib.sha1(' '.join(words).encode()).digest()
+        if digest in self._hashes:
+            self.exact += 1
+            return False
+        self._hashes.add(digest)
+
+        # Nothing to shingle, the exact hash is all we can go on
+        if len(words) == 0:
+            return True
+
+        sig = self.signature(words)
+        keys = [sig[band*self.rows:(band+1)*self.rows].tobytes() for band in range(self.bands)]
+
+        candidates = set()
+        for bucket, key in zip(self._buckets, keys):
+            candidates.update(bucket.get(key, ()))
+
+        for cand in candidates:
+            if np.mean(self._signatures[cand] == sig) >= self.threshold:
+                self.near += 1
+                return False
+
+        doc_id = len(self._signatures)
+        self._signatures.append(sig)
+        for bucket, key in zip(self._buckets, keys):
+            bucket.setdefault(key, []).append(doc_id)
+        return True
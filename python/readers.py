@@ -0,0 +1,78 @@
+import mailbox
+import os
+import tarfile
+
+# Streams messages straight out of the SpamAssassin tarballs and mbox files, so
+# they don't have to be unpacked and copied into one file per message first.
+# Every reader yields (source, text) pairs, with text decoded the same way
+# run_report.file_to_words reads a file.
+
+tar_suffixes = ('.tar', '.tar.bz2', '.tbz2', '.tar.gz', '.tgz', '.tar.xz')
+
+# Each corpus directory has a cmds file with the commands used to build it
+_skip_names = {'cmds'}
+
+def is_archive(path):
+    return path.endswith(tar_suffixes)
+
+# The corpus tarballs are named like 20030228_easy_ham.tar.bz2 and 20050311_spam_2.tar.bz2
+def archive_label(path):
+    return -1 if 'spam' in os.path.basename(path) else 1
+
+def iter_tar(path):
+    # r|* reads the archive as a stream, so it's decompressed once front to back
+    with tarfile.open(path, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile() or os.path.basename(member.name) in _skip_names:
+                continue
+            # The files in the provided link have invalid unicode sequences
+            text = tar.extractfile(member).read().decode(errors='ignore')
+            yield '{}:{}'.format(path, member.name), text
+
+def iter_mbox(path):
+    box = mailbox.mbox(path, create=False)
+    for key in box.iterkeys():
+        # Keep the From envelope line, process_email strips the header starting from it
+        yield '{}:{}'.format(path, key), box.get_bytes(key, from_=True).decode(errors='ignore')
+
+# Anything that isn't a tar archive is read as an mbox. Single message files look
+# like one message mboxes since the corpus files start with a From line, so callers
+# that might be handed one should read it themselves instead of coming through here.
+def iter_messages(path):
+    if is_archive(path):
+        return iter_tar(path)
+    return iter_mbox(path)
+
+# Yields (sign, source, text) for every message in each archive in turn,
+# with the sign taken from the archive name
+def iter_labeled(paths):
+    for path in paths:
+        sign = archive_label(path)
+        for source, text in iter_messages(path):
+            yield sign, source, text
+
+# Like iter_labeled, but takes one message from each archive in turn and runs them
+# through a shuffle buffer, so ham and spam stay mixed once the smaller archives
+# have run out. Only buffer_size messages are held at once, and every archive is
+# read through just once. rng is anything with numpy style randint and permutation,
+# like np.random.
+def iter_mixed(paths, rng, buffer_size=4096):
+    streams = [(archive_label(path), iter_messages(path)) for path in paths]
+    buffer = []
+    while streams:
+        live = []
+        for sign, stream in streams:
+            message = next(stream, None)
+            if message is None:
+                continue
+            live.append((sign, stream))
+            if len(buffer) < buffer_size:
+                buffer.append((sign,) + message)
+            else:
+                pos = rng.randint(buffer_size)
+                yield buffer[pos]
+                buffer[pos] = (sign,) + message
+        streams = live
+
+    for pos in rng.permutation(len(buffer)):
+        yield buffer[pos]
@@ -1,6 +1,7 @@
 #stdlib includes
 import argparse
-import matplotlib.pyplot as plt
+import time
+import tracemalloc
 
 # external includes
 import numpy as np
@@ -24,6 +25,20 @@ def gen_rands(center, num, var):
     cov = rotate @ stretch @ np.linalg.inv(rotate)
     return center + np.random.multivariate_normal(center, cov, num)
 
+# Spam-like bag of words data, num rows of dim binary word features with the given
+# fraction of spam. Every word gets a base rate around density, and half the words
+# are made shift times more likely in spam and the other half in ham.
+def gen_bag_of_words(num, dim, density, spam_frac, shift=2.0):
+    base = density * np.random.uniform(0.5, 1.5, dim)
+    spammy = np.random.rand(dim) < 0.5
+    ham_rates = np.minimum(np.where(spammy, base / shift, base * shift), 1)
+    spam_rates = np.minimum(np.where(spammy, base * shift, base / shift), 1)
+
+    num_spam = int(num * spam_frac)
+    ham = (np.random.rand(num - num_spam, dim) < ham_rates).astype(np.float64)
+    spam = (np.random.rand(num_spam, dim) < spam_rates).astype(np.float64)
+    return ham, spam
+
 colors = ['black', 'grey', 'brown', 'm', 'c', 'g', 'y']
 
 def plot_svm_line(a, b, sep, off, color, weight, ax):
@@ -36,6 +51,8 @@ def plot_svm_line(a, b, sep, off, color, weight, ax):
     ax.plot([x_min, x_max], [bottom, top], color=color, label=str(weight))
 
 def plot_svm(a, b, results, weights):
+    # matplotlib is slow to import, so it's only loaded once there's something to plot
+    import matplotlib.pyplot as plt
 
     fig, ax = plt.subplots()
     ax.scatter(a[:, 0],a[:, 1], color='blue')
@@ -66,6 +83,57 @@ def run_example(seed, num, weight, var):
 
     plot_svm(a_train, b_train, results, weights)
 
+# Tracing every allocation slows cvxpy's canonicalization down a lot, so the timed
+# run happens without tracemalloc and the peak memory comes from a second, traced run.
+# tracemalloc sees the numpy and cvxpy allocations made from python,
+# but not anything the solver mallocs internally.
+def time_training(ham, spam, weight):
+    start = time.perf_counter()
+    svm.train_linear_svm(ham, spam, weight)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    svm.train_linear_svm(ham, spam, weight)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+def plot_benchmark(sizes, dims, times, peaks):
+    import matplotlib.pyplot as plt
+
+    fig, (time_ax, mem_ax) = plt.subplots(1, 2)
+    for dim, color, dim_times, dim_peaks in zip(dims, colors, times, peaks):
+        time_ax.plot(sizes, dim_times, color=color, marker='o', label='D={}'.format(dim))
+        mem_ax.plot(sizes, np.array(dim_peaks) / 2**20, color=color, marker='o', label='D={}'.format(dim))
+
+    time_ax.set_xlabel('N')
+    time_ax.set_ylabel('seconds')
+    time_ax.legend(loc='upper left', shadow=True)
+    mem_ax.set_xlabel('N')
+    mem_ax.set_ylabel('peak MiB')
+    mem_ax.legend(loc='upper left', shadow=True)
+
+    plt.suptitle("train_linear_svm time and memory on synthetic bag of words data")
+    plt.show()
+
+def run_benchmark(seed, sizes, dims, weight, density, spam_frac):
+
+    np.random.seed(seed)
+
+    times = []
+    peaks = []
+    for dim in dims:
+        times.append([])
+        peaks.append([])
+        for num in sizes:
+            ham, spam = gen_bag_of_words(num, dim, density, spam_frac)
+            elapsed, peak = time_training(ham, spam, weight)
+            times[-1].append(elapsed)
+            peaks[-1].append(peak)
+            print("N={} D={}: {:.3f} seconds, {:.1f} MiB peak".format(num, dim, elapsed, peak / 2**20))
+
+    plot_benchmark(sizes, dims, times, peaks)
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Generate example plots for report',
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -77,10 +145,32 @@ if __name__ == '__main__':
                         default=200)
     parser.add_argument("--var", type=float, help="Variance of each cluster",
                         default=0.4)
+    parser.add_argument("--benchmark", action='store_true',
+                        help="Time training on synthetic bag of words data instead of plotting the example")
+    parser.add_argument("--sizes", type=int, nargs='+', help="Dataset sizes N to benchmark",
+                        default=[250, 500, 1000, 2000])
+    parser.add_argument("--dims", type=int, nargs='+', help="Feature counts D to benchmark",
+                        default=[100, 500, 1899])
+    parser.add_argument("--density", type=float, help="Average fraction of words present in a benchmark email",
+                        default=0.05)
+    parser.add_argument("--spam-frac", type=float, help="Fraction of benchmark emails that are spam",
+                        default=0.3)
 
     args = parser.parse_args()
 
     if args.weight < 0 or args.weight > 1:
         parser.error("Weight is {}, must be between zero and one".format(args.weight))
 
-    run_example(args.seed, args.num, args.weight, args.var)
+    if args.density <= 0 or args.density >= 1:
+        parser.error("Density is {}, must be between zero and one".format(args.density))
+
+    if args.spam_frac <= 0 or args.spam_frac >= 1:
+        parser.error("Spam fraction is {}, must be between zero and one".format(args.spam_frac))
+
+    if len(args.dims) > len(colors):
+        parser.error("At most {} dims can be benchmarked at once".format(len(colors)))
+
+    if args.benchmark:
+        run_benchmark(args.seed, args.sizes, args.dims, args.weight, args.density, args.spam_frac)
+    else:
+        run_example(args.seed, args.num, args.weight, args.var)
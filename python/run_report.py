@@ -4,50 +4,220 @@ import csv
 import glob
 import os
 
-from itertools import repeat
+from itertools import islice, repeat
 import concurrent.futures
 
 # external includes
 import numpy as np
-import scipy.io as sio
 
 #internal includes
-import stemmer
 import process_email
 import svm
+import calibration
+from dedup import DedupIndex
+from shards import ShardWriter, iter_batches
 
 def load_vocab(fname):
     with open(fname) as vocab:
         return {row['word']: int(row['index'])-1 for row in csv.DictReader(vocab, delimiter='\t')}
 
-# pool.map only allows one iterable, so I pack both into a tuple
-def file_to_word_vec(fname, vocab):
+def file_to_words(fname):
     # The files in the provided link have invalid unicode sequences
     with open(fname, errors='ignore') as email:
-        return_arr = np.zeros(len(vocab))
-        words = process_email.process_email(email.read())
-        for word in words:
-            if word in vocab:
-                return_arr[vocab[word]]=1
+        return process_email.process_email(email.read())
+
+def words_to_vec(words, vocab):
+    return_arr = np.zeros(len(vocab))
+    for word in words:
+        if word in vocab:
+            return_arr[vocab[word]]=1
     return return_arr
 
+# pool.map only allows one iterable, so I pack both into a tuple
+def file_to_word_vec(fname, vocab):
+    return words_to_vec(file_to_words(fname), vocab)
+
+# Takes the (sign, source, text) messages from readers.iter_labeled and iter_mixed
+def labeled_to_words(message):
+    sign, _, text = message
+    return sign, process_email.process_email(text)
 
-def split_train(vectors, percent):
-    shuffle = np.random.permutation(len(vectors))
+# executor.map submits everything it's given up front, so long streams are fed
+# to it in blocks to keep only a block's worth of messages in memory at once
+def bounded_map(executor, fn, items, chunksize=64, block=4096):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, block))
+        if not batch:
+            return
+        yield from executor.map(fn, batch, chunksize=chunksize)
 
-    vectors = vectors[shuffle]
-    len_to_take = int(len(vectors) * percent);
-    return vectors[:len_to_take], vectors[len_to_take:]
 
-def prepare_vectors(email_dir, percent, vocab):
+# Returns index arrays for the train and test rows, for when the vectors
+# shouldn't be copied at all
+def split_indices(num, percent):
+    shuffle = np.random.permutation(num)
+    len_to_take = int(num * percent)
+    return shuffle[:len_to_take], shuffle[len_to_take:]
+
+# With copy=False the rows are shuffled in place and the halves are views into
+# vectors, instead of making a shuffled copy of the whole matrix to slice from
+def split_train(vectors, percent, copy=True):
+    len_to_take = int(len(vectors) * percent)
+    if not copy:
+        np.random.shuffle(vectors)
+        return vectors[:len_to_take], vectors[len_to_take:]
+
+    train, test = split_indices(len(vectors), percent)
+    return vectors[train], vectors[test]
+
+# When given an index, duplicates are dropped before they're vectorized or split,
+# so copies of an email can't end up on both sides of the train/test boundary
+def prepare_vectors(email_dir, percent, vocab, index=None):
     files = glob.glob(email_dir + '/*')
     with concurrent.futures.ProcessPoolExecutor() as executor:
-        vectors = list(executor.map(file_to_word_vec, files, repeat(vocab)))
-    return split_train(np.stack(vectors), percent)
+        if index is None:
+            vectors = list(executor.map(file_to_word_vec, files, repeat(vocab)))
+        else:
+            vectors = [words_to_vec(words, vocab)
+                       for words in executor.map(file_to_words, files)
+                       if index.add(words)]
+    return split_train(np.stack(vectors), percent, copy=False)
+
+# Same as prepare_vectors, but reads the messages straight out of the downloaded
+# archives with the ham/spam label taken from each archive's name
+def prepare_archive_vectors(archives, percent, vocab, index=None):
+    # readers pulls in tarfile and mailbox, so it's only imported when reading archives
+    import readers
+
+    ham = []
+    spam = []
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        for sign, words in bounded_map(executor, labeled_to_words, readers.iter_labeled(archives)):
+            if index is not None and not index.add(words):
+                continue
+            (ham if sign > 0 else spam).append(words_to_vec(words, vocab))
+    return (split_train(np.stack(ham), percent, copy=False),
+            split_train(np.stack(spam), percent, copy=False))
 
-def run_report(data, seed, train, weight, use_download):
+# Writes a stream of (sign, is_train, words) into train and test shards,
+# dropping duplicates as the stream goes by
+def write_shards(stream, vocab, shard_dir, shard_size, index=None):
+    with ShardWriter(shard_dir, 'train', len(vocab), shard_size) as train_out, \
+         ShardWriter(shard_dir, 'test', len(vocab), shard_size) as test_out:
+        for sign, is_train, words in stream:
+            if index is not None and not index.add(words):
+                continue
+            out = train_out if is_train else test_out
+            out.append(words_to_vec(words, vocab), sign)
+    return train_out.count, test_out.count
+
+# Streams the corpus into train and test shards instead of stacking it in memory.
+# The split is decided per file up front, and ham and spam are interleaved so each
+# training batch sees both.
+def prepare_shards(ham_dir, spam_dir, percent, vocab, shard_dir, shard_size, index=None):
+    labeled = []
+    for email_dir, sign in ((ham_dir, 1), (spam_dir, -1)):
+        files = glob.glob(email_dir + '/*')
+        len_to_take = int(len(files) * percent)
+        for rank, pos in enumerate(np.random.permutation(len(files))):
+            labeled.append((files[pos], sign, rank < len_to_take))
+    labeled = [labeled[i] for i in np.random.permutation(len(labeled))]
+
+    files = [fname for fname, _, _ in labeled]
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        words = bounded_map(executor, file_to_words, files)
+        stream = ((sign, is_train, w) for (_, sign, is_train), w in zip(labeled, words))
+        return write_shards(stream, vocab, shard_dir, shard_size, index)
+
+# Messages come out of the archives already mixed, so rather than permuting a file
+# list up front each message lands in the training set with probability percent
+def prepare_archive_shards(archives, percent, vocab, shard_dir, shard_size, index=None):
+    import readers
+
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        messages = bounded_map(executor, labeled_to_words, readers.iter_mixed(archives, np.random))
+        stream = ((sign, np.random.rand() < percent, words) for sign, words in messages)
+        return write_shards(stream, vocab, shard_dir, shard_size, index)
+
+def score_shards(shard_dir, prefix, batch_size, weight, off):
+    correct = {1: 0, -1: 0}
+    total = {1: 0, -1: 0}
+    for vecs, signs in iter_batches(shard_dir, prefix, batch_size):
+        same = (vecs @ weight + off > 0) == (signs > 0)
+        for sign in (1, -1):
+            mask = signs == sign
+            correct[sign] += int(np.sum(same[mask]))
+            total[sign] += int(np.sum(mask))
+    # The archive split is random per message, so a small corpus can leave a class out
+    for sign, name in ((1, 'ham'), (-1, 'spam')):
+        if total[sign] == 0:
+            raise ValueError("No {} messages in the {} shards, use a lower --train or a "
+                             "bigger dataset".format(name, prefix))
+    ham_score = float(correct[1]) / total[1]
+    spam_score = float(correct[-1]) / total[-1]
+    total_score = float(correct[1] + correct[-1]) / (total[1] + total[-1])
+    return ham_score, spam_score, total_score
+
+def run_minibatch_report(data, train, dedup, batch_size, epochs, shard_size, save_model, archives):
+    vocab = load_vocab(os.path.join(data, 'vocab.txt'))
+
+    ham_dir = os.path.join(data, 'email_data', 'ham')
+    spam_dir = os.path.join(data, 'email_data', 'spam')
+    shard_dir = os.path.join(data, 'email_data', 'shards')
+
+    index = DedupIndex() if dedup else None
+    if archives:
+        num_train, num_test = prepare_archive_shards(archives, train, vocab,
+                                                     shard_dir, shard_size, index)
+    else:
+        num_train, num_test = prepare_shards(ham_dir, spam_dir, train, vocab,
+                                             shard_dir, shard_size, index)
+
+    if index is not None:
+        print("Dropped {} duplicate emails ({} exact, {} near)".format(
+            index.dropped, index.exact, index.near))
+
+    weight, off = svm.train_linear_svm_minibatch(
+        lambda: iter_batches(shard_dir, 'train', batch_size, np.random),
+        len(vocab), num_train, epochs)
+
+    if save_model is not None:
+        svm.save_model(save_model, weight, off)
+
+    return score_shards(shard_dir, 'test', batch_size, weight, off)
+
+# Fits a calibration on the margins of the held-out emails and sweeps every threshold
+# over them, so the operating point can be moved without solving the svm again.
+# Returns the threshold that keeps ham accuracy at min_ham, or zero if there's no target.
+def calibrate_svm(ham, spam, weight, off, kind, min_ham, curve):
+    margins = np.concatenate([ham @ np.ravel(weight), spam @ np.ravel(weight)]) + float(off)
+    signs = np.concatenate([np.ones(len(ham)), -1 * np.ones(len(spam))])
+
+    calibrator = calibration.calibrations[kind].fit(margins, signs)
+    thresholds, ham_acc, spam_acc = calibration.threshold_sweep(margins, signs)
+
+    if curve is not None:
+        with open(curve, 'w', newline='') as out:
+            writer = csv.writer(out)
+            writer.writerow(['threshold', 'ham_probability', 'ham_accuracy', 'spam_accuracy'])
+            writer.writerows(zip(thresholds, calibrator.predict(thresholds), ham_acc, spam_acc))
+
+    threshold = 0.0
+    if min_ham is not None:
+        threshold = calibration.pick_threshold(thresholds, ham_acc, spam_acc, min_ham)
+        print("Threshold {} keeps held-out ham accuracy at {}".format(threshold, min_ham))
+    return threshold, calibrator
+
+def run_report(data, seed, train, weight, use_download, dedup=False,
+               minibatch=False, batch_size=256, epochs=10, shard_size=4096, save_model=None,
+               archives=None, calibrate=0, calibration_kind='platt', min_ham=None, curve=None):
     np.random.seed(seed)
 
+    if minibatch:
+        return run_minibatch_report(data, train, dedup, batch_size, epochs, shard_size, save_model,
+                                    archives)
+
     if use_download:
         vocab_file = os.path.join(data, 'vocab.txt')
         with open(vocab_file) as vf:
@@ -56,10 +226,24 @@ def run_report(data, seed, train, weight, use_download):
         ham_dir = os.path.join(data, 'email_data', 'ham')
         spam_dir = os.path.join(data, 'email_data', 'spam')
 
-        ham_train, ham_test = prepare_vectors(ham_dir, train, vocab)
-        spam_train, spam_test = prepare_vectors(spam_dir, train, vocab)
+        # Shared between ham and spam so copies across the folders are caught too
+        index = DedupIndex() if dedup else None
+
+        if archives:
+            (ham_train, ham_test), (spam_train, spam_test) = prepare_archive_vectors(
+                archives, train, vocab, index)
+        else:
+            ham_train, ham_test = prepare_vectors(ham_dir, train, vocab, index)
+            spam_train, spam_test = prepare_vectors(spam_dir, train, vocab, index)
+
+        if index is not None:
+            print("Dropped {} duplicate emails ({} exact, {} near)".format(
+                index.dropped, index.exact, index.near))
 
     else:
+        # Only the provided samples need scipy, so it isn't imported up front
+        import scipy.io as sio
+
         mat_test = sio.loadmat(os.path.join(data, 'spamTest.mat'))
         mat_train = sio.loadmat(os.path.join('spamTrain.mat'))
 
@@ -75,10 +259,23 @@ def run_report(data, seed, train, weight, use_download):
         ham_test = test_x[test_y == 1]
         spam_test = test_x[test_y == 0]
 
+    if calibrate > 0:
+        ham_train, ham_calib = split_train(ham_train, 1 - calibrate, copy=False)
+        spam_train, spam_calib = split_train(spam_train, 1 - calibrate, copy=False)
+
     weight, off = svm.train_linear_svm(ham_train, spam_train, weight)
 
-    ham_score = svm.score_svm(ham_test, np.ones(len(ham_test)), weight, off)
-    spam_score = svm.score_svm(spam_test, -1*np.ones(len(spam_test)), weight, off)
+    threshold = 0.0
+    calibrator = None
+    if calibrate > 0:
+        threshold, calibrator = calibrate_svm(ham_calib, spam_calib, weight, off,
+                                              calibration_kind, min_ham, curve)
+
+    if save_model is not None:
+        svm.save_model(save_model, weight, off, **calibration.model_arrays(threshold, calibrator))
+
+    ham_score = svm.score_svm(ham_test, np.ones(len(ham_test)), weight, off - threshold)
+    spam_score = svm.score_svm(spam_test, -1*np.ones(len(spam_test)), weight, off - threshold)
     total_score = (ham_score * len(ham_test) + spam_score * len(spam_test)) / (len(ham_test) + len(spam_test))
     return ham_score, spam_score, total_score
 
@@ -95,6 +292,29 @@ if __name__ == '__main__':
                         default=0.5)
     parser.add_argument("--use-download", action='store_true',
                         help="Uses downloaded email dataset instead of provided samples")
+    parser.add_argument("--dedup", action='store_true',
+                        help="Drop exact and near duplicate emails from the downloaded dataset")
+    parser.add_argument("--minibatch", action='store_true',
+                        help="Train out of core with mini-batches over on-disk shards of the downloaded dataset")
+    parser.add_argument("--batch-size", type=int, help="Vectors per mini-batch",
+                        default=256)
+    parser.add_argument("--epochs", type=int, help="Passes over the training shards",
+                        default=10)
+    parser.add_argument("--shard-size", type=int, help="Vectors per on-disk shard",
+                        default=4096)
+    parser.add_argument("--save-model", help="Save the trained weights here for use with classify.py")
+    parser.add_argument("--archives", nargs='+',
+                        help="Read the downloaded dataset straight from these .tar.bz2 or mbox files, "
+                             "labelled spam if the name contains spam and ham otherwise")
+    parser.add_argument("--calibrate", type=float,
+                        help="Portion of the training data to hold out for calibration and threshold tuning",
+                        default=0)
+    parser.add_argument("--calibration", choices=sorted(calibration.calibrations),
+                        help="How to map margins to probabilities of ham", default='platt')
+    parser.add_argument("--min-ham", type=float,
+                        help="Pick the threshold with the best held-out spam accuracy that keeps "
+                             "held-out ham accuracy at least this high")
+    parser.add_argument("--curve", help="Write the held-out ham/spam accuracy tradeoff curve here as csv")
 
 
     args = parser.parse_args()
@@ -105,7 +325,31 @@ if __name__ == '__main__':
     if args.weight <= 0 or args.weight >= 1:
         parser.error("Spam weight is {}, must be between zero and one".format(args.weight))
 
-    ham, spam, total = run_report(args.data, args.seed, args.train, args.weight, args.use_download)
+    if args.minibatch and not args.use_download:
+        parser.error("Mini-batch training is only supported with --use-download")
+
+    if args.archives and not args.use_download:
+        parser.error("Reading archives is only supported with --use-download")
+
+    if args.dedup and not args.use_download:
+        parser.error("Deduplication is only supported with --use-download")
+
+    if args.calibrate < 0 or args.calibrate >= 1:
+        parser.error("Calibration portion is {}, must be between zero and one".format(args.calibrate))
+
+    if args.calibrate > 0 and args.minibatch:
+        parser.error("Calibration is not supported with --minibatch")
+
+    if (args.min_ham is not None or args.curve is not None) and args.calibrate == 0:
+        parser.error("--min-ham and --curve need a held out portion from --calibrate")
+
+    if args.min_ham is not None and (args.min_ham < 0 or args.min_ham > 1):
+        parser.error("Minimum ham accuracy is {}, must be between zero and one".format(args.min_ham))
+
+    ham, spam, total = run_report(args.data, args.seed, args.train, args.weight, args.use_download,
+                                  args.dedup, args.minibatch, args.batch_size, args.epochs,
+                                  args.shard_size, args.save_model, args.archives, args.calibrate,
+                                  args.calibration, args.min_ham, args.curve)
 
     print("Score on ham is ", ham)
     print("Score on spam is ", spam)
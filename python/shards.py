@@ -0,0 +1,74 @@
+import glob
+import os
+
+import numpy as np
+
+# The downloaded corpus is vectorized into fixed size shards on disk, so training
+# never needs more than one batch of it in memory at once. Each shard is a pair of
+# .npy files, the binary word features stored as uint8 and the +1/-1 labels as int8.
+#
+#   <shard_dir>/<prefix>_00000_x.npy
+#   <shard_dir>/<prefix>_00000_y.npy
+
+def shard_paths(shard_dir, prefix):
+    xs = sorted(glob.glob(os.path.join(shard_dir, prefix + '_*_x.npy')))
+    return [(x, x[:-len('_x.npy')] + '_y.npy') for x in xs]
+
+class ShardWriter:
+
+    def __init__(self, shard_dir, prefix, dim, shard_size):
+        os.makedirs(shard_dir, exist_ok=True)
+        # Leftovers from an earlier run would otherwise get mixed into this one
+        for x_path, y_path in shard_paths(shard_dir, prefix):
+            os.remove(x_path)
+            os.remove(y_path)
+
+        self.shard_dir = shard_dir
+        self.prefix = prefix
+        self.count = 0
+
+        self._x = np.zeros((shard_size, dim), dtype=np.uint8)
+        self._y = np.zeros(shard_size, dtype=np.int8)
+        self._filled = 0
+        self._shards = 0
+
+    def append(self, vec, label):
+        self._x[self._filled] = vec
+        self._y[self._filled] = label
+        self._filled += 1
+        self.count += 1
+        if self._filled == len(self._y):
+            self.flush()
+
+    def flush(self):
+        if self._filled == 0:
+            return
+        base = os.path.join(self.shard_dir, '{}_{:05d}'.format(self.prefix, self._shards))
+        np.save(base + '_x.npy', self._x[:self._filled])
+        np.save(base + '_y.npy', self._y[:self._filled])
+        self._filled = 0
+        self._shards += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+# Shards are memory mapped and read a batch at a time. When given an rng the shard
+# order and the batch order inside each shard are shuffled, but every batch is still
+# a contiguous slice so reads stay sequential within a shard.
+def iter_batches(shard_dir, prefix, batch_size, rng=None):
+    paths = shard_paths(shard_dir, prefix)
+    if rng is not None:
+        paths = [paths[i] for i in rng.permutation(len(paths))]
+
+    for x_path, y_path in paths:
+        x = np.load(x_path, mmap_mode='r')
+        y = np.load(y_path)
+        starts = np.arange(0, len(y), batch_size)
+        if rng is not None:
+            rng.shuffle(starts)
+        for start in starts:
+            yield (np.asarray(x[start:start+batch_size], dtype=np.float64),
+                   y[start:start+batch_size].astype(np.float64))
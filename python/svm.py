@@ -1,6 +1,4 @@
 import numpy as np
-import cvxpy as cvx
-from cvxpy import *
 
 # As it turns out, a linear svm does extremely well on the provided test and training sets
 # as such, I don't implement a solver on the dual to use a kernel trick since that would
@@ -20,6 +18,8 @@ from cvxpy import *
 #  - - - - - - - - - (seperating hyperplane)
 #  +  +  + (undesired side)
 def train_linear_svm(ham, spam, weight):
+    # cvxpy takes a long time to import, and is only needed for training
+    import cvxpy as cvx
 
     signs = np.concatenate([
         np.ones(len(ham)),
@@ -28,23 +28,93 @@ def train_linear_svm(ham, spam, weight):
 
     vecs = np.concatenate([ham, spam])
 
-    beta = Variable(len(ham[0]))
-    off = Variable()
-    slack = Variable(len(ham) + len(spam))
+    beta = cvx.Variable(len(ham[0]))
+    off = cvx.Variable()
+    slack = cvx.Variable(len(ham) + len(spam))
 
-    prob = Problem(Minimize(0.1*norm(beta) + cvx.sum(slack)),
-            [diag(signs) * (vecs * beta + off) >= 1 - slack,
+    prob = cvx.Problem(cvx.Minimize(0.1*cvx.norm(beta) + cvx.sum(slack)),
+            [cvx.diag(signs) * (vecs * beta + off) >= 1 - slack,
              slack >= 0])
 
     prob.solve(verbose=True)
 
     return beta.value, off.value
 
-def score_svm(emails, desired, weight, off):
-    val = emails @ weight + off
-    desired_pos = desired > 0
-    score_pos = val > 0
+# Scores chunk_size emails at a time into preallocated buffers, so evaluating a large
+# test set doesn't allocate several temporaries the length of the whole set
+def score_svm(emails, desired, weight, off, chunk_size=4096):
+    weight = np.ravel(weight)
+    off = float(off)
 
-    same = np.equal(desired_pos, score_pos)
+    chunk = max(1, min(chunk_size, len(emails)))
+    val = np.empty(chunk)
+    desired_pos = np.empty(chunk, dtype=bool)
+    score_pos = np.empty(chunk, dtype=bool)
 
-    return float(np.sum(same)) / len(same)
+    same = 0
+    for start in range(0, len(emails), chunk):
+        stop = min(start + chunk, len(emails))
+        n = stop - start
+
+        np.matmul(emails[start:stop], weight, out=val[:n])
+        val[:n] += off
+        np.greater(val[:n], 0, out=score_pos[:n])
+        np.greater(desired[start:stop], 0, out=desired_pos[:n])
+        np.equal(desired_pos[:n], score_pos[:n], out=score_pos[:n])
+        same += np.count_nonzero(score_pos[:n])
+
+    return float(same) / len(emails)
+
+# Same objective as train_linear_svm, but solved with mini-batch subgradient descent
+# so the data never has to be in memory at once. batches is called once per epoch and
+# should return an iterator of (vectors, signs) pairs, num is the total number of
+# training vectors so the objective can be scaled to a per-vector mean:
+#
+#   0.1/num * ||beta|| + mean(max(0, 1 - sign * (vec * beta + off)))
+#
+# The averaged iterate is returned, since the last one bounces around with the
+# noise in each batch.
+def train_linear_svm_minibatch(batches, dim, num, epochs=10, rate=0.5):
+    beta = np.zeros(dim)
+    off = 0.0
+    avg_beta = np.zeros(dim)
+    avg_off = 0.0
+    reg = 0.1 / num
+
+    t = 0
+    for epoch in range(epochs):
+        loss = 0.0
+        for vecs, signs in batches():
+            t += 1
+            step = rate / np.sqrt(t)
+
+            margin = signs * (vecs @ beta + off)
+            loss += np.sum(np.maximum(0, 1 - margin))
+            viol = margin < 1
+
+            grad_beta = -(signs[viol] @ vecs[viol]) / len(signs)
+            grad_off = -np.sum(signs[viol]) / len(signs)
+            norm = np.linalg.norm(beta)
+            if norm > 0:
+                grad_beta += reg * beta / norm
+
+            beta -= step * grad_beta
+            off -= step * grad_off
+
+            avg_beta += (beta - avg_beta) / t
+            avg_off += (off - avg_off) / t
+
+        print("Epoch {}: mean hinge loss {:.6f}".format(epoch, loss / num))
+
+    return avg_beta, avg_off
+
+# Models are kept as a plain .npz so they can be loaded without cvxpy installed.
+# Anything else to keep alongside the weights, like calibration.model_arrays, goes in extra.
+def save_model(fname, weight, off, **extra):
+    # np.savez tacks .npz onto a bare file name, so write through a handle to keep the exact path
+    with open(fname, 'wb') as out:
+        np.savez(out, weight=np.asarray(weight, dtype=np.float64).ravel(), off=float(off), **extra)
+
+def load_model(fname):
+    with np.load(fname) as model:
+        return model['weight'], float(model['off'])